@@ -0,0 +1,86 @@
+import asyncio
+import hmac
+import time
+from typing import Optional
+
+from pywebio.input import input, PASSWORD
+from pywebio.output import put_markdown, put_text, put_row, use_scope, clear, remove
+
+from models.snapshot import Snapshot
+from models.system import Config, Global
+
+
+def check_token(token: Optional[str]) -> bool:
+    if Config.ADMIN_TOKEN is None or token is None:
+        return False
+    # compare_digest 不支持非 ASCII 字符串，按 UTF-8 编码后比较
+    return hmac.compare_digest(token.encode(), Config.ADMIN_TOKEN.encode())
+
+
+ROW_SIZE = '1.2fr 1fr 0.6fr 1fr 0.8fr 1.2fr 0.8fr 1.2fr'
+
+
+def render_summary(stuck: set):
+    with use_scope('summary', clear=True):
+        put_text(f'在线用户 {len(Global.users)}，房间 {len(Snapshot.rooms)}')
+        if stuck:
+            put_markdown(f'**⚠️ {len(stuck)} 个房间在同一阶段停留超过 {Config.STUCK_STAGE_SECONDS} 秒**')
+
+
+def render_room(key: str, stuck: bool):
+    """更新单个房间所在的行，房间已注销时移除该行"""
+    room = Snapshot.rooms.get(key)
+    if room is None:
+        remove(f'room-{key}')
+        return
+
+    since = room['stage_since']
+    with use_scope('rooms'), use_scope(f'room-{key}', clear=True):
+        put_row([put_text(str(cell)) for cell in [
+            f'⚠️ {room["id"]}' if stuck else room['id'],
+            '游戏中' if room['started'] else '等待开始',
+            room['round'],
+            room['stage'] or '-',
+            '是' if room['waiting'] else '否',
+            time.strftime('%H:%M:%S', time.localtime(since)) if since else '-',
+            f'{len(room["players"])}/{room["capacity"]}',
+            room['host'] or '-',
+        ]], size=ROW_SIZE)
+
+
+async def admin():
+    """狼人杀管理页面"""
+    put_markdown('## 狼人杀服务器状态')
+    if Config.ADMIN_TOKEN is None:
+        put_text('未启用管理页面，请使用 --admin-token 参数启动服务器')
+        return
+    if not check_token(await input('管理令牌', type=PASSWORD, required=True)):
+        put_text('令牌错误')
+        return
+
+    put_text('JSON 快照：/admin/snapshot.json?token=<管理令牌>')
+    with use_scope('summary'):
+        pass
+    put_row([put_markdown(f'**{title}**') for title in [
+        '房间号', '状态', '轮次', '阶段', '等待操作', '进入阶段时间', '人数', '房主'
+    ]], size=ROW_SIZE)
+    with use_scope('rooms'):
+        pass
+
+    version, stuck, summary = None, set(), None
+    while True:
+        # 只重新渲染快照版本 version 之后变化过的房间，以及停留超时状态变化的房间
+        keys = None if version is None else Snapshot.changes(version)
+        version = Snapshot.version
+        current_stuck = set(Snapshot.stuck_rooms())
+        if keys is None:
+            clear('rooms')
+            keys = list(Snapshot.rooms)
+        for key in dict.fromkeys(keys + list(current_stuck ^ stuck)):
+            render_room(key, key in current_stuck)
+        stuck = current_stuck
+
+        if summary != (len(Global.users), len(Snapshot.rooms), len(stuck)):
+            summary = (len(Global.users), len(Snapshot.rooms), len(stuck))
+            render_summary(stuck)
+        await asyncio.sleep(1)
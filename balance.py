@@ -0,0 +1,205 @@
+"""
+房间配置平衡性分析
+
+用简单的策略模型批量模拟所有房间配置下的对局，生成狼人胜率表，供创建房间时查询
+
+    python balance.py --games 2000
+
+策略模型：
+1. 狼人随机击杀一名存活的非狼人玩家
+2. 预言家随机查验一名未查验过的存活玩家
+3. 女巫在规则允许时总是救下当晚被杀的玩家，否则以一定概率随机毒杀一名玩家，解药和毒药各只能使用一次
+4. 守卫随机守护一名存活玩家，不连续两晚守护同一玩家
+5. 白天投票时，预言家存活且已查验出存活的狼人时出局该狼人，否则随机出局一名存活玩家
+6. 猎人、狼王没有技能
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations
+from typing import List, Optional
+
+from enums import Role, WitchRule, GuardRule
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'balance.json')
+
+WOLF_ROLES = [Role.WOLF, Role.WOLF_KING]
+GOD_ROLES = [Role.DETECTIVE, Role.WITCH, Role.GUARD, Role.HUNTER]
+
+
+def config_key(roles: List[Role], witch_rule: WitchRule, guard_rule: GuardRule) -> str:
+    """房间配置的查询键，规则对结果无影响时（如未配置女巫）统一取第一个选项"""
+    counter = Counter(roles)
+    if Role.WITCH not in counter:
+        witch_rule = list(WitchRule)[0]
+    if Role.WITCH not in counter or Role.GUARD not in counter:
+        guard_rule = list(GuardRule)[0]
+    roles_key = ','.join(f'{role.name}={counter[role]}' for role in Role if counter[role])
+    return f'{roles_key};{witch_rule.name};{guard_rule.name}'
+
+
+@lru_cache(maxsize=1)
+def load_table() -> dict:
+    if not os.path.exists(TABLE_PATH):
+        return dict()
+    with open(TABLE_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def wolf_win_rate(roles: List[Role], witch_rule: WitchRule, guard_rule: GuardRule) -> Optional[float]:
+    """查询预计算的狼人胜率，胜率表中不存在该配置时返回 None"""
+    return load_table().get(config_key(roles, witch_rule, guard_rule))
+
+
+def simulate(roles: List[Role], witch_rule: WitchRule, guard_rule: GuardRule, games: int, rng,
+             poison_rate=0.3) -> float:
+    """以 games 局为一批，向量化模拟对局，返回狼人胜率"""
+    import numpy as np
+
+    n, p = games, len(roles)
+    rows = np.arange(n)
+    seats = np.arange(p)
+
+    # 每局随机分配身份，(n, p)
+    role_ids = np.array([list(Role).index(role) for role in roles])
+    role_of = np.take_along_axis(
+        np.broadcast_to(role_ids, (n, p)), rng.random((n, p)).argsort(axis=1), axis=1
+    )
+
+    def is_role(*candidates):
+        return np.isin(role_of, [list(Role).index(role) for role in candidates])
+
+    wolf = is_role(*WOLF_ROLES)
+    citizen = is_role(Role.CITIZEN)
+    god = is_role(*GOD_ROLES)
+    has_god = any(role in GOD_ROLES for role in roles)
+
+    def seat_of(role):
+        """每局中该身份的座位号，未配置时为 -1"""
+        mask = is_role(role)
+        return np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
+
+    detective, witch, guard = seat_of(Role.DETECTIVE), seat_of(Role.WITCH), seat_of(Role.GUARD)
+
+    def choose(mask):
+        """每局在 mask 内随机选择一个座位，没有可选座位时为 -1"""
+        scores = np.where(mask, rng.random((n, p)), -1.0)
+        return np.where(mask.any(axis=1), scores.argmax(axis=1), -1)
+
+    def seat_alive(seat):
+        return (seat >= 0) & alive[rows, np.maximum(seat, 0)]
+
+    def kill(seat, active):
+        hit = active & (seat >= 0)
+        alive[rows[hit], seat[hit]] = False
+
+    alive = np.ones((n, p), dtype=bool)
+    done = np.zeros(n, dtype=bool)
+    wolf_win = np.zeros(n, dtype=bool)
+    checked = np.zeros((n, p), dtype=bool)
+    has_heal = witch >= 0
+    has_poison = witch >= 0
+    last_protect = np.full(n, -1)
+
+    def check_result():
+        """与 Room.check_result 相同的胜负判断"""
+        lose = ~(alive & citizen).any(axis=1)
+        if has_god:
+            lose |= ~(alive & god).any(axis=1)
+        win = ~(alive & wolf).any(axis=1)
+        wolf_win[~done & lose] = True
+        done[lose | win] = True
+
+    for night in range(1, p + 1):
+        active = ~done
+
+        # 狼人
+        victim = choose(alive & ~wolf)
+
+        # 预言家
+        detective_acts = active & seat_alive(detective)
+        target = choose(alive & ~checked & (seats != detective[:, None]))
+        checked[rows[detective_acts & (target >= 0)], target[detective_acts & (target >= 0)]] = True
+
+        # 女巫
+        witch_acts = active & seat_alive(witch)
+        can_heal = witch_acts & has_heal & (victim >= 0)
+        if witch_rule == WitchRule.NO_SELF_RESCUE or (witch_rule == WitchRule.SELF_RESCUE_FIRST_NIGHT_ONLY and night != 1):
+            can_heal &= victim != witch
+        healed = can_heal
+        has_heal &= ~healed
+        poisons = witch_acts & ~healed & has_poison & (rng.random(n) < poison_rate)
+        poisoned = np.where(poisons, choose(alive & (seats != witch[:, None])), -1)
+        has_poison &= ~poisons
+
+        # 守卫
+        guard_acts = active & seat_alive(guard)
+        protect = np.where(guard_acts, choose(alive & (seats != last_protect[:, None])), -1)
+        last_protect = np.where(guard_acts, protect, last_protect)
+
+        # 结算
+        guarded = (protect == victim) & (victim >= 0)
+        survive = (healed | guarded) & ~(healed & guarded & (guard_rule == GuardRule.MED_CONFLICT))
+        kill(victim, active & ~survive)
+        kill(poisoned, active)
+        check_result()
+
+        # 白天投票
+        active = ~done
+        if not active.any():
+            break
+        known = alive & checked & wolf & seat_alive(detective)[:, None]
+        kill(np.where(known.any(axis=1), choose(known), choose(alive)), active)
+        check_result()
+        if done.all():
+            break
+
+    return float(wolf_win[done].mean()) if done.any() else 0.0
+
+
+def iter_configs(max_wolves: int, max_citizens: int):
+    """房间设置表单可选的全部配置"""
+    for wolf_num in range(0, max_wolves + 1):
+        for god_wolf_num in range(len(Role.god_wolf_mapping()) + 1):
+            for god_wolf in combinations(Role.god_wolf_mapping().values(), god_wolf_num):
+                if wolf_num + len(god_wolf) == 0:
+                    continue
+                for citizen_num in range(1, max_citizens + 1):
+                    for god_citizen_num in range(len(Role.god_citizen_mapping()) + 1):
+                        for god_citizen in combinations(Role.god_citizen_mapping().values(), god_citizen_num):
+                            roles = [Role.WOLF] * wolf_num + [Role.CITIZEN] * citizen_num
+                            roles += list(god_wolf) + list(god_citizen)
+                            for witch_rule in WitchRule:
+                                for guard_rule in GuardRule:
+                                    yield roles, witch_rule, guard_rule
+
+
+def build_table(games: int, max_wolves: int, max_citizens: int, seed: int = None) -> dict:
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    table = dict()
+    for roles, witch_rule, guard_rule in iter_configs(max_wolves, max_citizens):
+        key = config_key(roles, witch_rule, guard_rule)
+        if key not in table:
+            table[key] = round(simulate(roles, witch_rule, guard_rule, games, rng), 3)
+    return table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='生成房间配置的狼人胜率表（需要 numpy）')
+    parser.add_argument('--games', type=int, default=2000, help='每种配置模拟的对局数')
+    parser.add_argument('--max-wolves', type=int, default=4, help='普通狼数上限')
+    parser.add_argument('--max-citizens', type=int, default=6, help='普通村民数上限')
+    parser.add_argument('--seed', type=int, default=None, help='随机种子')
+    parser.add_argument('--output', default=TABLE_PATH, help='输出文件')
+    args = parser.parse_args()
+
+    started_at = time.perf_counter()
+    result = build_table(args.games, args.max_wolves, args.max_citizens, args.seed)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+    print(f'共 {len(result)} 种配置，耗时 {time.perf_counter() - started_at:.1f} 秒，已写入 {args.output}')
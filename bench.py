@@ -0,0 +1,138 @@
+"""
+Web 服务后端性能对比
+
+分别以各个后端启动服务器，用相同的机器人负载（连接、输入昵称、进入大厅并保持连接）比较 session 吞吐量和内存占用
+
+    python bench.py --sessions 300 --concurrency 50
+
+机器人客户端需要 aiohttp，内存占用读取自 /proc，仅支持 Linux
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Optional, List
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def rss(pid) -> Optional[int]:
+    """进程的常驻内存，单位为字节，无法读取时返回 None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def wait_ready(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise TimeoutError(f'服务器未在 {timeout} 秒内启动')
+
+
+async def login(session, url, nick):
+    """连接并输入昵称，收到大厅表单时返回仍保持连接的 websocket"""
+    ws = await session.ws_connect(url)
+    while True:
+        msg = await ws.receive_json()
+        if msg['command'] != 'input_group':
+            continue
+        if msg['spec']['label'] == '大厅':
+            return ws
+        name = msg['spec']['inputs'][0]['name']
+        await ws.send_json(dict(event='from_submit', task_id=msg['task_id'], data={name: nick}))
+
+
+async def run_workload(port, pid, sessions, concurrency) -> dict:
+    """sessions 个机器人以 concurrency 的并发数登录，全部进入大厅后记录服务器内存"""
+    import aiohttp
+
+    url = f'http://127.0.0.1:{port}/?app=index'
+    semaphore = asyncio.Semaphore(concurrency)
+    connections = []
+
+    async def bot(nick):
+        async with semaphore:
+            connections.append(await login(session, url, nick))
+
+    # 每个机器人占用一个连接，不限制连接池大小
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        started_at = time.perf_counter()
+        await asyncio.gather(*[bot(f'bot{idx}') for idx in range(sessions)])
+        cost = time.perf_counter() - started_at
+        loaded_rss = rss(pid)
+
+        for ws in connections:
+            await ws.close()
+
+    return dict(sessions_per_second=sessions / cost, loaded_rss=loaded_rss)
+
+
+def bench(backend, sessions, concurrency) -> dict:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, MAIN_PATH, '--backend', backend, '--host', '127.0.0.1', '--port', str(port),
+         '--log-level', 'WARNING'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(wait_ready(port))
+        result = dict(backend=backend, idle_rss=rss(server.pid))
+        result.update(loop.run_until_complete(run_workload(port, server.pid, sessions, concurrency)))
+        return result
+    finally:
+        loop.close()
+        server.terminate()
+        server.wait()
+
+
+def report(results: List[dict], sessions) -> str:
+    def mb(size):
+        return '-' if size is None else f'{size / 1024 / 1024:.1f} MB'
+
+    def per_session(result):
+        if result['idle_rss'] is None or result['loaded_rss'] is None:
+            return '-'
+        return f'{(result["loaded_rss"] - result["idle_rss"]) / sessions / 1024:.1f} KB'
+
+    lines = [f'{"后端":<10}{"session/s":>12}{"空载内存":>12}{"满载内存":>12}{"每 session":>12}']
+    for result in results:
+        lines.append(
+            f'{result["backend"]:<10}{result["sessions_per_second"]:>12.1f}'
+            f'{mb(result["idle_rss"]):>12}{mb(result["loaded_rss"]):>12}{per_session(result):>12}'
+        )
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='比较各 Web 服务后端的 session 吞吐量和内存占用（需要 aiohttp）')
+    parser.add_argument('--sessions', type=int, default=300, help='机器人数量，不能超过 Config.MAX_SESSIONS')
+    parser.add_argument('--concurrency', type=int, default=50, help='同时登录的机器人数量')
+    parser.add_argument('--backends', nargs='+', choices=['tornado', 'aiohttp'], default=['tornado', 'aiohttp'])
+    args = parser.parse_args()
+
+    results = []
+    for backend in args.backends:
+        results.append(bench(backend, args.sessions, args.concurrency))
+    print(f'{args.sessions} 个 session，并发 {args.concurrency}')
+    print(report(results, args.sessions))
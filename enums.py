@@ -26,6 +26,7 @@ class PlayerStatus(PlainEnum):
 
 class GameStage(Enum):
     Day = 'Day'
+    VOTE = '投票'
     WOLF = '狼人'
     DETECTIVE = '预言家'
     WITCH = '女巫'
@@ -0,0 +1,115 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+CONTEXT_FIELDS = ['room', 'round', 'stage', 'nick']
+
+
+class DroppingQueueHandler(QueueHandler):
+    """有界日志队列，队列满时丢弃日志并计数，不阻塞事件循环"""
+
+    def __init__(self, maxsize: int):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 不在调用方格式化，消息和异常堆栈均由后台线程的 Formatter 处理
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    同一条日志模板在 period 秒内最多记录 burst 次，其余计入下一条记录的 suppressed 字段
+
+    以未格式化的模板作为 key，日志调用须使用 %s 参数而非 f-string；max_level 及以上级别的日志不限流
+    """
+
+    def __init__(self, burst=5, period=60.0, max_keys=1000, max_level=logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.max_keys = max_keys
+        self.max_level = max_level
+        self.windows = dict()  # (logger, 模板) -> [窗口开始时间, 已记录数, 已抑制数]
+
+    def filter(self, record):
+        if record.levelno >= self.max_level:
+            return True
+        now = time.monotonic()
+        if len(self.windows) > self.max_keys:
+            self.windows.clear()
+        window = self.windows.get((record.name, record.msg))
+        if window is None or now - window[0] > self.period:
+            suppressed = window[2] if window else 0
+            window = self.windows[(record.name, record.msg)] = [now, 0, 0]
+            if suppressed:
+                record.suppressed = suppressed
+
+        if window[1] >= self.burst:
+            window[2] += 1
+            return False
+        window[1] += 1
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """结构化日志，附带房间号、轮次、阶段和昵称"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ['suppressed']:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'suppressed', None):
+            text += f' (已省略 {record.suppressed} 条相同日志)'
+        return text
+
+
+def setup_logging(json_format=False, queue_size=10000) -> DroppingQueueHandler:
+    """
+    配置日志
+
+    日志记录仅在调用方入队，格式化和写入 stdout 由后台线程完成，stdout 阻塞时不影响事件循环
+    """
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT))
+
+    queue_handler = DroppingQueueHandler(queue_size)
+    queue_handler.addFilter(RateLimitFilter())
+    logging.getLogger().addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, stream_handler)
+    listener.start()
+
+    def stop():
+        listener.stop()
+        if queue_handler.dropped:
+            print(f'日志队列已满，共丢弃 {queue_handler.dropped} 条日志', file=sys.stderr)
+
+    atexit.register(stop)
+    return queue_handler
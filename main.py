@@ -1,18 +1,37 @@
+import time
+
+STARTUP_AT = time.perf_counter()
+
+from utils import StartupProfile
+
+# 按依赖分别记录导入耗时，更细的导入耗时可使用 python -X importtime main.py 查看
+STARTUP_PROFILE = StartupProfile(STARTUP_AT)
+
+import argparse
 import asyncio
-import sys
-from logging import getLogger, basicConfig
+from logging import getLogger
+
+import user_agents  # pywebio 的依赖，导入时编译 UA 正则表
+STARTUP_PROFILE.mark('导入 user_agents')
+import tornado.web  # pywebio 在导入时加载 tornado 后端
+STARTUP_PROFILE.mark('导入 tornado')
 
-from pywebio import start_server
 from pywebio.input import *
 from pywebio.output import *
-from pywebio.session import defer_call, get_current_task_id
+from pywebio import run_async
+from pywebio.session import defer_call, get_current_task_id, get_current_session
+STARTUP_PROFILE.mark('导入 pywebio')
 
+from admin import admin, check_token
 from enums import WitchRule, GuardRule, Role, GameStage
+from log import setup_logging
 from models.room import Room
+from models.snapshot import Snapshot
+from models.system import Config, Global
 from models.user import User
-from utils import add_cancel_button, get_interface_ip
+from utils import get_interface_ip, run_in_background, close_current_session
+STARTUP_PROFILE.mark('导入项目模块')
 
-basicConfig(stream=sys.stdout, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = getLogger('Wolf')
 logger.setLevel('DEBUG')
 
@@ -21,32 +40,85 @@ async def main():
     """狼人杀"""
     put_markdown("## 狼人杀法官")
 
-    current_user = User.alloc(
-        await input('请输入你的昵称',
-                    required=True,
-                    validate=User.validate_nick,
-                    help_text='请使用一个易于分辨的名称'),
-        get_current_task_id()
-    )
+    if Global.is_sessions_full():
+        put_text('服务器繁忙，请稍后再试')
+        return
+
+    Global.sessions += 1
+
+    @defer_call
+    def on_session_close():
+        Global.sessions -= 1
+
+    login_timer = run_async(login_timeout()) if Config.LOGIN_TIMEOUT is not None else None
+    nick = await input('请输入你的昵称',
+                       required=True,
+                       validate=User.validate_nick,
+                       help_text='请使用一个易于分辨的名称')
+    if login_timer is not None:
+        login_timer.close()
+
+    current_user = User.alloc(nick, get_current_task_id())
 
     @defer_call
     def on_close():
         User.free(current_user)
 
+    try:
+        await play(current_user)
+    finally:
+        # 主 Task 结束后，不再由空闲回收线程维持 session；session 关闭时由 PyWebIO 统一结束所有 Task
+        if not get_current_session().closed():
+            current_user.stop_idle_reaper()
+
+
+async def login_timeout():
+    """超过 Config.LOGIN_TIMEOUT 未输入昵称时关闭 session"""
+    await asyncio.sleep(Config.LOGIN_TIMEOUT)
+    logger.info('长时间未输入昵称，断开连接')
+    close_current_session()
+
+
+async def play(current_user: User):
+    """大厅及房间内操作"""
     put_text(f'你好，{current_user.nick}')
     data = await input_group(
         '大厅', inputs=[actions(name='cmd', buttons=['创建房间', '加入房间'])]
     )
+    current_user.touch()
 
     if data['cmd'] == '创建房间':
-        room_config = await input_group('房间设置', inputs=[
-            input(name='wolf_num', label='普通狼数', type=NUMBER, value='3'),
-            checkbox(name='god_wolf', label='特殊狼', inline=True, options=Role.as_god_wolf_options()),
-            input(name='citizen_num', label='普通村民数', type=NUMBER, value='4'),
-            checkbox(name='god_citizen', label='特殊村民', inline=True, options=Role.as_god_citizen_options()),
-            select(name='witch_rule', label='女巫解药规则', options=WitchRule.as_options()),
-            select(name='guard_rule', label='守卫规则', options=GuardRule.as_options()),
-        ])
+        if Global.is_rooms_full():
+            put_text('服务器繁忙，暂时无法创建房间，请稍后再试')
+            return
+        room_config = dict(wolf_num=3, god_wolf=[], citizen_num=4, god_citizen=[], witch_rule=None, guard_rule=None)
+        while True:
+            room_config = await input_group('房间设置', inputs=[
+                input(name='wolf_num', label='普通狼数', type=NUMBER, value=str(room_config['wolf_num'])),
+                checkbox(name='god_wolf', label='特殊狼', inline=True, options=Role.as_god_wolf_options(),
+                         value=room_config['god_wolf']),
+                input(name='citizen_num', label='普通村民数', type=NUMBER, value=str(room_config['citizen_num'])),
+                checkbox(name='god_citizen', label='特殊村民', inline=True, options=Role.as_god_citizen_options(),
+                         value=room_config['god_citizen']),
+                select(name='witch_rule', label='女巫解药规则', options=WitchRule.as_options(),
+                       value=room_config['witch_rule']),
+                select(name='guard_rule', label='守卫规则', options=GuardRule.as_options(),
+                       value=room_config['guard_rule']),
+            ])
+            current_user.touch()
+
+            # 创建房间前展示预估胜率，供房主调整配置
+            rate = Room.estimate_wolf_win_rate(room_config)
+            confirm = await actions(
+                f'预估狼人胜率 ≈ {rate:.0%}' if rate is not None else '暂无该配置的预估狼人胜率',
+                buttons=['创建房间', '重新设置'],
+            )
+            current_user.touch()
+            if confirm == '创建房间':
+                break
+        if Global.is_rooms_full():
+            put_text('服务器繁忙，暂时无法创建房间，请稍后再试')
+            return
         room = Room.alloc(room_config)
     elif data['cmd'] == '加入房间':
         room = Room.get(await input('房间号', type=TEXT, validate=Room.validate_room_join))
@@ -56,7 +128,7 @@ async def main():
     put_scrollable(current_user.game_msg, height=200, keep_bottom=True)
     current_user.game_msg.append(put_text(room.desc()))
 
-    room.add_player(current_user)
+    await room.add_player(current_user)
 
     while True:
         await asyncio.sleep(0.2)
@@ -67,23 +139,23 @@ async def main():
                 host_ops = [
                     actions(name='host_op', buttons=['开始游戏'], help_text='你是房主')
                 ]
-            elif room.stage == GameStage.Day and room.round > 0:
-                host_ops = [
-                    actions(
-                        name='host_vote_op',
-                        buttons=[user.nick for user in room.list_alive_players()],
-                        help_text='你是房主，本轮需要选择出局玩家'
-                    )
-                ]
 
         # 玩家操作
         user_ops = []
         if room.started:
+            if room.stage == GameStage.VOTE and current_user.can_vote():
+                user_ops = [
+                    actions(
+                        name='vote_op',
+                        buttons=room.alive_player_buttons(cancelable=True),
+                        help_text='请投票选择出局玩家，放弃即为弃票。'
+                    )
+                ]
             if room.stage == GameStage.WOLF and current_user.should_act():
                 user_ops = [
                     actions(
                         name='wolf_team_op',
-                        buttons=add_cancel_button([user.nick for user in room.list_alive_players()]),
+                        buttons=room.alive_player_buttons(cancelable=True),
                         help_text='狼人阵营，请选择要击杀的对象。'
                     )
                 ]
@@ -91,7 +163,7 @@ async def main():
                 user_ops = [
                     actions(
                         name='detective_team_op',
-                        buttons=[user.nick for user in room.list_alive_players()],
+                        buttons=room.alive_player_buttons(),
                         help_text='预言家，请选择要查验的对象。'
                     )
                 ]
@@ -105,7 +177,7 @@ async def main():
                     radio(name='witch_mode', options=['解药', '毒药'], required=True, inline=True),
                     actions(
                         name='witch_team_op',
-                        buttons=add_cancel_button([user.nick for user in room.list_alive_players()]),
+                        buttons=room.alive_player_buttons(cancelable=True),
                         help_text='女巫，请选择你的操作。'
                     )
                 ]
@@ -113,12 +185,12 @@ async def main():
                 user_ops = [
                     actions(
                         name='guard_team_op',
-                        buttons=add_cancel_button([user.nick for user in room.list_alive_players()]),
+                        buttons=room.alive_player_buttons(cancelable=True),
                         help_text='守卫，请选择你的操作。'
                     )
                 ]
             if room.stage == GameStage.HUNTER and current_user.should_act():
-                current_user.hunter_gun_status()
+                await current_user.hunter_gun_status()
 
         ops = host_ops + user_ops
         if not ops:
@@ -129,34 +201,153 @@ async def main():
             current_user.input_blocking = True
         data = await input_group('操作', inputs=host_ops + user_ops, cancelable=True)
         current_user.input_blocking = False
+        current_user.touch()
 
         # Canceled
         if data is None:
-            current_user.skip()
+            if room.stage == GameStage.VOTE:
+                await current_user.vote(None)
+            else:
+                await current_user.skip()
             continue
 
         # Host logic
         if data.get('host_op') == '开始游戏':
             await room.start_game()
-        if data.get('host_vote_op'):
-            await room.vote_kill(data.get('host_vote_op'))
+        # Vote logic
+        if data.get('vote_op'):
+            await current_user.vote(data.get('vote_op'))
         # Wolf logic
         if data.get('wolf_team_op'):
-            current_user.wolf_kill_player(nick=data.get('wolf_team_op'))
+            await current_user.wolf_kill_player(nick=data.get('wolf_team_op'))
         # Detective logic
         if data.get('detective_team_op'):
-            current_user.detective_identify_player(nick=data.get('detective_team_op'))
+            await current_user.detective_identify_player(nick=data.get('detective_team_op'))
         # Witch logic
         if data.get('witch_team_op'):
             if data.get('witch_mode') == '解药':
-                current_user.witch_heal_player(nick=data.get('witch_team_op'))
+                await current_user.witch_heal_player(nick=data.get('witch_team_op'))
             elif data.get('witch_mode') == '毒药':
-                current_user.witch_kill_player(nick=data.get('witch_team_op'))
+                await current_user.witch_kill_player(nick=data.get('witch_team_op'))
         # Guard logic
         if data.get('guard_team_op'):
-            current_user.guard_protect_player(nick=data.get('guard_team_op'))
+            await current_user.guard_protect_player(nick=data.get('guard_team_op'))
+
+
+# 访问 /?app=admin 进入管理页面
+APPLICATIONS = {'index': main, 'admin': admin}
+
+
+def log_server_address(port: int, profile: StartupProfile = None):
+    started_at = time.perf_counter()
+    ip = get_interface_ip()
+    if profile:
+        logger.info('获取本机 IP（后台）: %.1f ms', (time.perf_counter() - started_at) * 1000)
+    address = ip if port == 80 else f'{ip}:{port}'
+    logger.info('狼人杀服务器启动成功！可以通过在浏览器内输入 http://%s 来加入游戏', address)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='狼人杀法官')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=80, help='监听端口')
+    parser.add_argument('--backend', choices=['tornado', 'aiohttp'], default='tornado', help='Web 服务后端')
+    parser.add_argument('--uvloop', action='store_true', help='使用 uvloop 事件循环（需要安装 uvloop）')
+    parser.add_argument('--websocket-ping-interval', type=float, default=None, help='websocket 心跳间隔，单位为秒')
+    parser.add_argument('--websocket-ping-timeout', type=float, default=None,
+                        help='websocket 心跳超时，单位为秒，仅 tornado 后端支持')
+    parser.add_argument('--log-level', default='DEBUG', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='日志级别')
+    parser.add_argument('--log-format', default='text', choices=['text', 'json'], help='日志格式')
+    parser.add_argument('--log-queue-size', type=int, default=10000, help='日志队列长度，队列满时丢弃日志')
+    parser.add_argument('--admin-token', default=None, help='管理页面令牌，不设置时不启用管理页面')
+    parser.add_argument('--startup-profile', action='store_true', help='打印启动各阶段及主要依赖的导入耗时')
+    return parser.parse_args()
+
+
+def serve_tornado(args, on_ready):
+    import tornado.ioloop
+    import tornado.web
+    from pywebio.platform.tornado import webio_handler
+    from pywebio.utils import STATIC_PATH
+
+    class SnapshotHandler(tornado.web.RequestHandler):
+        def get(self):
+            if not check_token(self.get_argument('token', None)):
+                raise tornado.web.HTTPError(403)
+            self.set_header('Content-Type', 'application/json; charset=utf-8')
+            self.write(Snapshot.to_json())
+
+    settings = dict(
+        websocket_ping_interval=args.websocket_ping_interval,
+        websocket_ping_timeout=args.websocket_ping_timeout,
+    )
+    app = tornado.web.Application(handlers=[
+        (r'/', webio_handler(APPLICATIONS, cdn=False)),
+        (r'/admin/snapshot.json', SnapshotHandler),
+        (r'/(.*)', tornado.web.StaticFileHandler, {'path': STATIC_PATH, 'default_filename': 'index.html'}),
+    ], **{key: value for key, value in settings.items() if value is not None})
+    app.listen(args.port, address=args.host)
+
+    print(f'Listen on {args.host}:{args.port}')
+    tornado.ioloop.IOLoop.current().add_callback(on_ready)
+    tornado.ioloop.IOLoop.current().start()
+
+
+def serve_aiohttp(args, on_ready):
+    from aiohttp import web
+    from pywebio.platform.aiohttp import webio_handler, static_routes
+    STARTUP_PROFILE.mark('导入 aiohttp')
+
+    websocket_settings = {}
+    if args.websocket_ping_interval:
+        websocket_settings['heartbeat'] = args.websocket_ping_interval
+
+    async def on_startup(app):
+        on_ready()
+
+    async def snapshot(request):
+        if not check_token(request.query.get('token')):
+            raise web.HTTPForbidden()
+        return web.Response(text=Snapshot.to_json(), content_type='application/json')
+
+    async def make_app():
+        # webio_handler 在创建时绑定当前事件循环，须在 run_app 运行的事件循环内创建
+        app = web.Application()
+        app.router.add_routes([
+            web.get('/', webio_handler(APPLICATIONS, cdn=False, websocket_settings=websocket_settings)),
+            web.get('/admin/snapshot.json', snapshot),
+        ])
+        app.router.add_routes(static_routes())
+        app.on_startup.append(on_startup)
+        return app
+
+    web.run_app(make_app(), host=args.host, port=args.port)
 
 
 if __name__ == '__main__':
-    logger.info(f"狼人杀服务器启动成功！可以通过在浏览器内输入 http://{get_interface_ip()} 来加入游戏")
-    start_server(main, debug=False, host='0.0.0.0', port=80, cdn=False)
+    args = parse_args()
+
+    setup_logging(json_format=args.log_format == 'json', queue_size=args.log_queue_size)
+    Config.ADMIN_TOKEN = args.admin_token
+    for name in ['Wolf', 'Model', 'Utils']:
+        getLogger(name).setLevel(args.log_level)
+
+    if args.uvloop:
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            logger.warning('未安装 uvloop，使用默认事件循环')
+
+    STARTUP_PROFILE.mark('初始化')
+
+    def on_server_ready():
+        STARTUP_PROFILE.mark('启动服务')
+        if args.startup_profile:
+            logger.info('启动耗时\n%s', STARTUP_PROFILE.report())
+
+    run_in_background(log_server_address, args.port, STARTUP_PROFILE if args.startup_profile else None)
+    if args.backend == 'aiohttp':
+        serve_aiohttp(args, on_server_ready)
+    else:
+        serve_tornado(args, on_server_ready)
@@ -0,0 +1,73 @@
+import itertools
+import json
+import os
+import time
+from enum import Enum
+from typing import Optional
+
+import enums
+from models.system import Config
+from . import logger
+
+
+def encode(value):
+    """将命令参数转换为可 JSON 序列化的值，枚举记录为 {'enum': 类名, 'name': 成员名}"""
+    if isinstance(value, Enum):
+        return {'enum': type(value).__name__, 'name': value.name}
+    return value
+
+
+def decode(value):
+    if isinstance(value, dict) and 'enum' in value:
+        return getattr(enums, value['enum'])[value['name']]
+    return value
+
+
+class ReplayWriter:
+    """对局记录，每个事件写为一行 JSON"""
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, event: dict):
+        self.file.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.file.close()
+
+    @classmethod
+    def open(cls, room_id) -> Optional['ReplayWriter']:
+        """
+        在 Config.REPLAY_DIR 下创建对局记录文件，同名文件已存在时添加序号
+
+        未配置目录、或无法创建文件时返回 None，对局记录不影响游戏进行
+        """
+        if Config.REPLAY_DIR is None:
+            return None
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{room_id}'
+        try:
+            os.makedirs(Config.REPLAY_DIR, exist_ok=True)
+            for idx in itertools.count():
+                path = os.path.join(Config.REPLAY_DIR, f'{name}-{idx}.jsonl' if idx else f'{name}.jsonl')
+                try:
+                    return cls(open(path, 'x', encoding='utf-8', buffering=1))
+                except FileExistsError:
+                    continue
+        except OSError:
+            logger.exception('无法创建对局记录 "%s"', name, extra=dict(room=room_id))
+            return None
+
+
+class ReplayRecorder(ReplayWriter):
+    """将对局记录保存在内存中，用于回放校验"""
+
+    def __init__(self):
+        super().__init__(None)
+        self.events = []
+
+    def write(self, event: dict):
+        # 经过一次序列化，与从文件中读取的事件保持一致
+        self.events.append(json.loads(json.dumps(event, ensure_ascii=False)))
+
+    def close(self):
+        pass
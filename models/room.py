@@ -1,22 +1,37 @@
 import asyncio
 import random
+import time
 from collections import Counter
 from copy import copy
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Tuple, Union
 
-from pywebio import run_async
-from pywebio.session.coroutinebased import TaskHandle
-
+from balance import wolf_win_rate
 from enums import Role, WitchRule, GuardRule, GameStage, LogCtrl, PlayerStatus
+from models.replay import ReplayWriter, encode
+from models.snapshot import Snapshot
 from models.system import Global, Config
 from models.user import User
-from utils import say
+from utils import say, add_cancel_button
 from . import logger
 
 
+def records_itself(func):
+    """标记自行写入对局记录的命令，命令队列不再重复记录"""
+    func.records_itself = True
+    return func
+
+
 @dataclass
 class Room:
+    __slots__ = (
+        'id', 'roles', 'witch_rule', 'guard_rule',
+        'started', 'roles_pool', 'players', 'round', 'stage', 'waiting', 'log',
+        'last_active', 'logic_task', 'commands', 'command_loop', 'version', 'alive_version',
+        'buttons_cache', 'buttons_cache_version', 'journal', 'votes', 'vote_counts',
+        'seats', 'rematch_at',
+    )
+
     id: Optional[int]  # 这个 id 应该在注册房间至 room registry 时，由 Global manager 写入
     # Static settings
     roles: List[Role]
@@ -26,63 +41,95 @@ class Room:
     # Dynamic
     started: bool  # 游戏开始状态
     roles_pool: List[Role]  # 用于记录角色分配剩余状态
-    players: Dict[str, User]  # 房间内玩家
+    players: Dict[str, User]  # 房间内玩家，按座位排序
+    seats: List[str]  # 座位顺序，玩家离开后保留座位，重新加入时回到原座位
     round: int  # 轮次
     stage: Optional[GameStage]  # 游戏阶段
     waiting: bool  # 等待玩家操作
+    rematch_at: Optional[float]  # 自动开始下一局的时间，time.monotonic()，不在倒计时中时为 None
     log: List[Tuple[Union[str, None], Union[str, LogCtrl]]]  # 广播消息源，(目标, 内容)
+    votes: Dict[str, Optional[str]]  # 本轮投票，投票人 -> 投票对象，弃票时为 None
+    vote_counts: Counter  # 本轮票数，投票对象 -> 票数
+    last_active: float  # 最后一次房间活动的时间，time.monotonic()
 
     # Internal
-    logic_thread: Optional[TaskHandle]
+    logic_task: Optional[asyncio.Task]  # 游戏主逻辑，由房间持有，不随任何玩家的 session 结束
+    commands: Optional[asyncio.Queue]  # 房间状态修改命令队列，(命令, args, kwargs, future)
+    command_loop: Optional[asyncio.Task]  # 命令队列执行者
+    version: int  # 房间状态版本，每执行一条命令时递增，见 changed()
+    alive_version: int  # 存活玩家版本，玩家出局、复活或进出房间时递增，见 alive_changed()
+    buttons_cache: Dict[bool, list]  # 存活玩家操作按钮缓存，key 为是否带有放弃按钮
+    buttons_cache_version: int  # buttons_cache 对应的存活玩家版本
+    journal: Optional[ReplayWriter]  # 本局对局记录，游戏进行中时存在
+
+    async def game_logic(self):
+        """游戏主逻辑，夜晚与白天投票交替进行，游戏结束后倒计时自动开始下一局"""
+        await asyncio.sleep(5)
+        while True:
+            while self.started:
+                await self.night_logic()
+                if self.started:
+                    await self.day_logic()
+
+            if not await self.rematch():
+                return
+
+    async def rematch(self) -> bool:
+        """倒计时结束后保留房间和座位，直接分配身份开始下一局，无法开始时返回 False"""
+        if Config.REMATCH_COUNTDOWN is None:
+            return False
+
+        await self.execute(self.start_rematch_countdown)
+        while time.monotonic() < self.rematch_at:
+            await asyncio.sleep(0.2)
+
+        if not await self.execute(self.deal_roles):
+            return False
+        await asyncio.sleep(5)
+        return True
+
+    def start_rematch_countdown(self):
+        """开始下一局倒计时，由命令队列执行"""
+        self.rematch_at = time.monotonic() + Config.REMATCH_COUNTDOWN
+        self.broadcast_msg(f'{Config.REMATCH_COUNTDOWN} 秒后自动开始下一局，房主可以立即开始')
+
+    def skip_rematch_countdown(self):
+        """立即结束下一局倒计时，由命令队列执行"""
+        if self.rematch_at is not None:
+            self.rematch_at = time.monotonic()
 
     async def night_logic(self):
         """单夜逻辑"""
         # 开始
-        self.round += 1
-        self.broadcast_msg('天黑请闭眼', tts=True)
+        await self.execute(self.enter_night)
         await asyncio.sleep(3)
 
         # 狼人
-        self.stage = GameStage.WOLF
-        self.broadcast_msg('狼人请出现', tts=True)
-        await self.wait_for_player()
-        self.broadcast_msg('狼人请闭眼', tts=True)
+        await self.wait_for_player(GameStage.WOLF)
         await asyncio.sleep(3)
 
         # 预言家
         if Role.DETECTIVE in self.roles:
-            self.stage = GameStage.DETECTIVE
-            self.broadcast_msg('预言家请出现', tts=True)
-            await self.wait_for_player()
-            self.broadcast_msg('预言家请闭眼', tts=True)
+            await self.wait_for_player(GameStage.DETECTIVE)
             await asyncio.sleep(3)
 
         # 女巫
         if Role.WITCH in self.roles:
-            self.stage = GameStage.WITCH
-            self.broadcast_msg('女巫请出现', tts=True)
-            await self.wait_for_player()
-            self.broadcast_msg('女巫请闭眼', tts=True)
+            await self.wait_for_player(GameStage.WITCH)
             await asyncio.sleep(3)
 
         # 守卫
         if Role.GUARD in self.roles:
-            self.stage = GameStage.GUARD
-            self.broadcast_msg('守卫请出现', tts=True)
-            await self.wait_for_player()
-            self.broadcast_msg('守卫请闭眼', tts=True)
+            await self.wait_for_player(GameStage.GUARD)
             await asyncio.sleep(3)
 
         # 猎人
         if Role.HUNTER in self.roles:
-            self.stage = GameStage.HUNTER
-            self.broadcast_msg('猎人请出现', tts=True)
-            await self.wait_for_player()
-            self.broadcast_msg('猎人请闭眼', tts=True)
+            await self.wait_for_player(GameStage.HUNTER)
             await asyncio.sleep(3)
 
         # 检查结果
-        self.check_result()
+        await self.execute(self.check_result)
 
     def check_result(self, is_vote_check=False):
         """检查结果，在投票后、及夜晚结束时被调用"""
@@ -110,6 +157,8 @@ class Room:
             if user.status in [PlayerStatus.PENDING_DEAD, PlayerStatus.PENDING_POISON]:
                 self.players[nick].status = PlayerStatus.DEAD
                 out_result.append(nick)
+        if out_result:
+            self.alive_changed()
 
         if not citizen_team or (not self.is_no_god() and not god_team):
             self.stop_game('狼人胜利')
@@ -125,21 +174,100 @@ class Room:
             self.broadcast_msg('等待投票')
             return
 
-    async def vote_kill(self, nick):
+    async def day_logic(self):
+        """白天投票逻辑，所有存活玩家投票完成或超时后结算"""
+        await self.execute(self.start_vote)
+        deadline = time.monotonic() + Config.VOTE_TIMEOUT
+        while self.waiting and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        await self.execute(self.resolve_vote)
+
+    def start_vote(self):
+        """开始投票，由命令队列执行"""
+        self.stage = GameStage.VOTE
+        self.waiting = True
+        self.votes = dict()
+        self.vote_counts = Counter()
+        self.broadcast_msg(f'请所有存活玩家投票，{Config.VOTE_TIMEOUT} 秒内未投票视为弃票', tts=True)
+
+    def cast_vote(self, voter: str, nick: Optional[str]):
+        """玩家投票，nick 为 None 时弃票，由命令队列执行"""
+        if self.stage != GameStage.VOTE or voter in self.votes:
+            return
+        if voter not in self.players or self.players[voter].status == PlayerStatus.DEAD:
+            return
+        if nick is not None and (nick not in self.players or self.players[nick].status == PlayerStatus.DEAD):
+            return
+
+        self.votes[voter] = nick
+        if nick is not None:
+            self.vote_counts[nick] += 1
+
+        counts = '，'.join(f'{target} {count} 票' for target, count in self.vote_counts.most_common())
+        self.broadcast_msg(
+            f'{voter} {"弃票" if nick is None else f"投票给 {nick}"}，'
+            f'当前 {counts or "无人得票"}（已投 {len(self.votes)}/{len(self.list_alive_players())}）'
+        )
+        self.check_votes()
+
+    def drop_votes(self, nick: str):
+        """玩家在投票阶段离开房间时，作废其投出的票和投给其的票，投给其的玩家可以重新投票"""
+        self.votes = {voter: target for voter, target in self.votes.items() if nick not in (voter, target)}
+        self.vote_counts = Counter(target for target in self.votes.values() if target is not None)
+        self.broadcast_msg(f'{nick} 离开房间，与其相关的投票已作废')
+        self.check_votes()
+
+    def check_votes(self):
+        """所有存活玩家均已投票时结束等待"""
+        if len(self.votes) >= len(self.list_alive_players()):
+            self.waiting = False
+
+    def resolve_vote(self):
+        """结算投票，最高票且不平票的玩家出局，由命令队列执行"""
+        self.waiting = False
+        self.broadcast_log_ctrl(LogCtrl.RemoveInput)
+
+        top = self.vote_counts.most_common(2)
+        if not top or (len(top) > 1 and top[0][1] == top[1][1]):
+            self.broadcast_msg('投票结束，无人得票或平票，无人出局', tts=True)
+            self.enter_null_stage()
+            return
+
+        self.broadcast_msg(f'投票结束，{top[0][0]} 以 {top[0][1]} 票出局', tts=True)
+        self.kill_by_vote(top[0][0])
+
+    def kill_by_vote(self, nick):
+        """投票出局，由命令队列执行"""
         self.players[nick].status = PlayerStatus.DEAD
+        self.alive_changed()
         self.check_result(is_vote_check=True)
         if self.started:
             self.enter_null_stage()
-            await self.start_game()  # 下一夜
 
-    async def wait_for_player(self):
-        """玩家操作等待锁"""
-        self.waiting = True
+    async def wait_for_player(self, stage: GameStage):
+        """进入夜晚阶段，并等待玩家操作"""
+        await self.execute(self.enter_stage, stage)
         while True:
             await asyncio.sleep(0.1)
             if self.waiting is False:
-                self.broadcast_log_ctrl(LogCtrl.RemoveInput)
                 break
+        await self.execute(self.leave_stage, stage)
+
+    def enter_night(self):
+        """进入夜晚，由命令队列执行"""
+        self.round += 1
+        self.broadcast_msg('天黑请闭眼', tts=True)
+
+    def enter_stage(self, stage: GameStage):
+        """进入夜晚阶段，锁定并等待玩家操作，由命令队列执行"""
+        self.stage = stage
+        self.waiting = True
+        self.broadcast_msg(f'{stage.value}请出现', tts=True)
+
+    def leave_stage(self, stage: GameStage):
+        """结束夜晚阶段，由命令队列执行"""
+        self.broadcast_log_ctrl(LogCtrl.RemoveInput)
+        self.broadcast_msg(f'{stage.value}请闭眼', tts=True)
 
     def enter_null_stage(self):
         """
@@ -150,37 +278,82 @@ class Room:
         self.stage = None
 
     async def start_game(self):
-        """开始游戏/下一夜"""
-        if not self.started:
-            if self.logic_thread is not None and not self.logic_thread.closed():
-                logger.error('没有正确关闭上一局游戏')
-                return
+        """开始游戏，在下一局倒计时中调用时立即开始下一局"""
+        logic_running = self.logic_task is not None and not self.logic_task.done()
+        if logic_running and self.rematch_at is not None:
+            await self.execute(self.skip_rematch_countdown)
+            return
 
-            if len(self.players) != len(self.roles):
-                self.broadcast_msg('人数不足，无法开始游戏')
-                return
+        if logic_running:
+            logger.error('没有正确关闭上一局游戏', extra=self.log_context())
+            return
 
-            # 游戏状态
-            self.started = True
+        if not await self.execute(self.deal_roles):
+            return
 
-            # 分配身份
-            self.broadcast_msg('游戏开始，请查看你的身份', tts=True)
-            random.shuffle(self.roles_pool)
-            for nick in self.players:
-                self.players[nick].role = self.roles_pool.pop()
-                self.players[nick].status = PlayerStatus.ALIVE
-                # 女巫道具
-                if self.players[nick].role == Role.WITCH:
-                    self.players[nick].skill['poison'] = True
-                    self.players[nick].skill['heal'] = True
-                # 守卫守护记录
-                if self.players[nick].role == Role.GUARD:
-                    self.players[nick].skill['last_protect'] = None
-                self.players[nick].send_msg(f'你的身份是 "{self.players[nick].role}"')
+        # 不使用 run_async，否则房主断开连接时主逻辑随其 session 一同关闭
+        self.logic_task = asyncio.get_event_loop().create_task(self.game_logic())
+        self.logic_task.add_done_callback(self._game_logic_done)
+
+    def _game_logic_done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('房间 "%s" 游戏主逻辑异常退出', self.id, exc_info=task.exception(), extra=self.log_context())
 
-            await asyncio.sleep(5)
+    def stop_game_logic(self):
+        if self.logic_task is not None:
+            self.logic_task.cancel()
+            self.logic_task = None
 
-        self.logic_thread = run_async(self.night_logic())
+    def deal_roles(self, seed: int = None, journal: ReplayWriter = None) -> bool:
+        """
+        开始游戏并分配身份，由命令队列执行，无法开始时返回 False
+
+        :param seed: 身份分配的随机种子，默认随机生成
+        :param journal: 本局对局记录，默认按 Config.REPLAY_DIR 创建
+        """
+        if self.started:
+            return False
+
+        self.rematch_at = None
+        if len(self.players) != len(self.roles):
+            self.broadcast_msg('人数不足，无法开始游戏')
+            return False
+
+        # 对局记录，在修改游戏状态前创建，创建失败时不记录
+        seed = random.getrandbits(32) if seed is None else seed
+        self.journal = journal or ReplayWriter.open(self.id)
+
+        # 游戏状态
+        self.started = True
+        self.seats = list(self.players)
+        self.touch()
+
+        self.record(
+            type='game',
+            seed=seed,
+            roles=[role.name for role in self.roles],
+            roles_pool=[role.name for role in self.roles_pool],
+            witch_rule=self.witch_rule.name,
+            guard_rule=self.guard_rule.name,
+            players=list(self.players),
+        )
+
+        # 分配身份
+        self.broadcast_msg('游戏开始，请查看你的身份', tts=True)
+        random.Random(seed).shuffle(self.roles_pool)
+        for nick in self.players:
+            self.players[nick].role = self.roles_pool.pop()
+            self.players[nick].status = PlayerStatus.ALIVE
+            # 女巫道具
+            if self.players[nick].role == Role.WITCH:
+                self.players[nick].witch_poison = True
+                self.players[nick].witch_heal = True
+            # 守卫守护记录
+            if self.players[nick].role == Role.GUARD:
+                self.players[nick].guard_last_protect = None
+            self.players[nick].send_msg(f'你的身份是 "{self.players[nick].role}"')
+        self.record(type='deal', roles={nick: user.role.name for nick, user in self.players.items()})
+        return True
 
     def stop_game(self, reason=''):
         """结束游戏"""
@@ -189,17 +362,42 @@ class Room:
         self.round = 0
         self.enter_null_stage()
         self.waiting = False
+        self.touch()
+
+        self.record(
+            type='end',
+            reason=reason,
+            players={nick: [encode(user.role), encode(user.status)] for nick, user in self.players.items()},
+        )
+        self.close_journal()
 
         self.broadcast_msg(f'游戏结束，{reason}。', tts=True)
         for nick, user in self.players.items():
             self.broadcast_msg(f'{nick}：{user.role} ({user.status})')
             self.players[nick].role = None
             self.players[nick].status = None
+        self.alive_changed()
 
     def list_alive_players(self) -> list:
         """返回存活的 User，包括 PENDING_DEAD 状态的玩家"""
         return [user for user in self.players.values() if user.status != PlayerStatus.DEAD]
 
+    def alive_player_buttons(self, cancelable=False) -> list:
+        """
+        以存活玩家为选项的操作按钮
+
+        存活玩家不变时，所有玩家打开的操作表单共用同一份按钮列表，存活玩家变化后重建
+        """
+        if self.buttons_cache_version != self.alive_version:
+            self.buttons_cache = dict()
+            self.buttons_cache_version = self.alive_version
+
+        if cancelable not in self.buttons_cache:
+            # 预先规范化为 dict，PyWebIO 渲染时无需再逐个转换
+            buttons = [dict(label=user.nick, value=user.nick, type='submit') for user in self.list_alive_players()]
+            self.buttons_cache[cancelable] = add_cancel_button(buttons) if cancelable else buttons
+        return self.buttons_cache[cancelable]
+
     def list_pending_kill_players(self) -> list:
         return [user for user in self.players.values() if user.status == PlayerStatus.PENDING_DEAD]
 
@@ -214,33 +412,188 @@ class Room:
                 return False
         return True
 
-    def add_player(self, user: 'User'):
-        """添加一个用户到房间"""
-        if user.room or user.nick in self.players:
-            raise AssertionError
-        self.players[user.nick] = user
-        user.room = self
+    async def add_player(self, user: 'User'):
+        """添加一个用户到房间，在用户 session 内调用"""
+        players_status = await self.execute(self.join, user)
         user.start_syncer()  # will run later
-
-        players_status = f'人数 {len(self.players)}/{len(self.roles)}，房主是 {self.get_host()}'
         user.game_msg.append(players_status)
-        self.broadcast_msg(players_status)
-        logger.info(f'用户 "{user.nick}" 加入房间 "{self.id}"')
 
     def remove_player(self, user: 'User'):
-        """将用户从房间移除"""
+        """将用户从房间移除，在用户 session 内调用，可在 defer_call 中调用"""
         if user.nick not in self.players:
             raise AssertionError
-        self.players.pop(user.nick)
-        user.stop_syncer()
-        user.room = None
+        if user.game_msg_syncer is not None:  # session 在加入房间的过程中关闭时，尚未启动同步
+            user.stop_syncer()
+        self.submit(self.leave, user)
+
+    @records_itself
+    def join(self, user: 'User') -> str:
+        """玩家加入房间，由命令队列执行，返回房间人数信息"""
+        if user.room or user.nick in self.players:
+            raise AssertionError
+        self.seat_player(user)
+        self.touch()
+
+        players_status = f'人数 {len(self.players)}/{len(self.roles)}，房主是 {self.get_host()}'
+        self.broadcast_msg(players_status)
+        logger.info('用户 "%s" 加入房间 "%s"', user.nick, self.id, extra=user.log_context())
+        return players_status
+
+    @records_itself
+    def leave(self, user: 'User'):
+        """玩家离开房间，由命令队列执行"""
+        self.unseat_player(user)
+        self.touch()
 
         if not self.players:
-            Global.remove_room(self.id)
+            # 注销房间会结束命令队列，在本条命令执行完成后进行
+            if self.started or Config.EMPTY_ROOM_KEEPALIVE is None:
+                asyncio.get_event_loop().call_soon(self.destroy_if_empty)
+            else:
+                # 未开始游戏的空房间保留一段时间，供玩家重新加入
+                asyncio.get_event_loop().call_later(Config.EMPTY_ROOM_KEEPALIVE, self.destroy_if_empty)
             return
 
         self.broadcast_msg(f'人数 {len(self.players)}/{len(self.roles)}，房主是 {self.get_host()}')
-        logger.info(f'用户 "{user.nick}" 离开房间 "{self.id}"')
+        logger.info('用户 "%s" 离开房间 "%s"', user.nick, self.id, extra=dict(self.log_context(), nick=user.nick))
+
+    def seat_player(self, user: 'User'):
+        """玩家入座，仅修改房间状态，游戏进行中时写入对局记录"""
+        if user.nick not in self.seats:
+            if len(self.seats) >= len(self.roles) * 2:
+                self.seats = [nick for nick in self.seats if nick in self.players]
+            self.seats.append(user.nick)
+        self.players[user.nick] = user
+        self.players = {nick: self.players[nick] for nick in self.seats if nick in self.players}
+        user.room = self
+        self.alive_changed()
+        self.record(type='join', nick=user.nick)
+
+    def unseat_player(self, user: 'User'):
+        """玩家离座，仅修改房间状态，游戏进行中时写入对局记录"""
+        self.players.pop(user.nick)
+        user.room = None
+        self.alive_changed()
+        self.record(type='leave', nick=user.nick)
+        if self.stage == GameStage.VOTE:
+            self.drop_votes(user.nick)
+
+    def alive_changed(self):
+        """存活玩家变化后调用，使存活玩家按钮缓存失效"""
+        self.alive_version += 1
+
+    def changed(self):
+        """房间状态变化后调用，更新版本号和管理页面快照"""
+        self.version += 1
+        if self.id is not None:
+            Snapshot.update_room(self)
+
+    def destroy(self):
+        """注销房间"""
+        self.close_journal()
+        self.stop_game_logic()
+        self.stop_command_loop()
+        Global.remove_room(self.id)
+        Snapshot.remove_room(self.id)
+
+    def destroy_if_empty(self):
+        if not self.players:
+            self.destroy()
+
+    # 命令队列
+    def start_command_loop(self):
+        if self.command_loop is None:
+            self.commands = asyncio.Queue(maxsize=Config.ROOM_COMMAND_QUEUE_SIZE)
+            self.command_loop = asyncio.get_event_loop().create_task(self._command_loop())
+
+    async def execute(self, func, *args, **kwargs):
+        """
+        提交一个修改房间状态的命令，并等待其执行结果
+
+        房间状态只由 command_loop 依次执行命令来修改，命令须为同步函数，执行期间不会与其他命令交错
+        """
+        self.start_command_loop()
+
+        # PyWebIO 的 Task 在唤醒时直接取 future.result()，因此异常随结果一同返回，在此处重新抛出
+        future = asyncio.get_event_loop().create_future()
+        await self.commands.put((func, args, kwargs, future))
+        ok, rv = await future
+        if not ok:
+            raise rv
+        return rv
+
+    async def _command_loop(self):
+        """房间状态的唯一修改者"""
+        while True:
+            func, args, kwargs, future = await self.commands.get()
+            try:
+                self.record_command(func, args, kwargs)
+                rv = (True, func(*args, **kwargs))
+            except Exception as e:
+                logger.exception('房间 "%s" 执行命令 %s 失败', self.id, func.__name__, extra=self.log_context())
+                rv = (False, e)
+            self.changed()
+            if not future.done():
+                future.set_result(rv)
+
+    def submit(self, func, *args, **kwargs):
+        """在同步代码中提交一个命令，不等待执行结果，队列已满时在后台等待入队"""
+        self.start_command_loop()
+        command = (func, args, kwargs, asyncio.get_event_loop().create_future())
+        try:
+            self.commands.put_nowait(command)
+        except asyncio.QueueFull:
+            asyncio.get_event_loop().create_task(self.commands.put(command))
+
+    def stop_command_loop(self):
+        if self.command_loop is not None:
+            self.command_loop.cancel()
+            self.command_loop = None
+            self.commands = None
+
+    # 对局记录
+    def record(self, **event):
+        """写入一条对局记录，游戏未进行时忽略，写入失败时放弃本局记录"""
+        if self.journal is None:
+            return
+        try:
+            self.journal.write(event)
+        except OSError:
+            logger.exception('房间 "%s" 写入对局记录失败，本局不再记录', self.id, extra=self.log_context())
+            self.close_journal()
+
+    def record_command(self, func, args: tuple, kwargs: dict):
+        """记录一条命令，玩家操作的第一个参数为执行操作的 User"""
+        if self.journal is None or getattr(func, 'records_itself', False):
+            return
+        actor = None
+        if args and isinstance(args[0], User):
+            actor, args = args[0].nick, args[1:]
+        self.record(
+            type='cmd',
+            round=self.round,
+            stage=encode(self.stage),
+            cmd=func.__name__,
+            actor=actor,
+            args=[encode(arg) for arg in args],
+            kwargs={key: encode(value) for key, value in kwargs.items()},
+        )
+
+    def close_journal(self):
+        if self.journal is not None:
+            journal, self.journal = self.journal, None
+            try:
+                journal.close()
+            except OSError:
+                logger.exception('房间 "%s" 关闭对局记录失败', self.id, extra=self.log_context())
+
+    def log_context(self) -> dict:
+        """结构化日志字段"""
+        return dict(room=self.id, round=self.round, stage=self.stage.value if self.stage else None)
+
+    def touch(self):
+        """记录房间活动时间"""
+        self.last_active = time.monotonic()
 
     def get_host(self):
         if not self.players:
@@ -253,7 +606,7 @@ class Room:
 
     def broadcast_msg(self, text: str, tts=False):
         """广播一条消息到所有房间内玩家"""
-        if tts:
+        if tts and Config.TTS:
             say(text)
 
         self.log.append((Config.SYS_NICK, text))
@@ -263,39 +616,75 @@ class Room:
         self.log.append((None, ctrl_type))
 
     def desc(self):
-        return f'房间号 {self.id}，' \
+        desc = f'房间号 {self.id}，' \
                f'需要玩家 {len(self.roles)} 人，' \
                f'人员配置：{dict(Counter(self.roles))}'
+        rate = wolf_win_rate(self.roles, self.witch_rule, self.guard_rule)
+        if rate is not None:
+            desc += f'，预估狼人胜率 ≈ {rate:.0%}'
+        return desc
 
     @classmethod
-    def alloc(cls, room_setting) -> 'Room':
-        """Create room by setting and register it to global storage"""
-        # build full role list
+    def roles_from_setting(cls, room_setting) -> List[Role]:
+        """Build full role list from room setting"""
         roles = []
         roles.extend([Role.WOLF] * room_setting['wolf_num'])
         roles.extend([Role.CITIZEN] * room_setting['citizen_num'])
         roles.extend(Role.from_option(room_setting['god_wolf']))
         roles.extend(Role.from_option(room_setting['god_citizen']))
+        return roles
+
+    @classmethod
+    def estimate_wolf_win_rate(cls, room_setting) -> Optional[float]:
+        """按房间设置查询预估狼人胜率，胜率表中不存在该配置时返回 None"""
+        return wolf_win_rate(
+            cls.roles_from_setting(room_setting),
+            WitchRule.from_option(room_setting['witch_rule']),
+            GuardRule.from_option(room_setting['guard_rule']),
+        )
+
+    @classmethod
+    def alloc(cls, room_setting) -> 'Room':
+        """Create room by setting and register it to global storage"""
+        room = Global.reg_room(cls.new(
+            roles=cls.roles_from_setting(room_setting),
+            witch_rule=WitchRule.from_option(room_setting['witch_rule']),
+            guard_rule=GuardRule.from_option(room_setting['guard_rule']),
+        ))
+        Snapshot.update_room(room)
+        return room
 
-        # Go
-        return Global.reg_room(
-            cls(
-                id=None,
-                # Static settings
-                roles=copy(roles),
-                witch_rule=WitchRule.from_option(room_setting['witch_rule']),
-                guard_rule=GuardRule.from_option(room_setting['guard_rule']),
-                # Dynamic
-                started=False,
-                roles_pool=copy(roles),
-                players=dict(),
-                round=0,
-                stage=None,
-                waiting=False,
-                log=list(),
-                # Internal
-                logic_thread=None,
-            )
+    @classmethod
+    def new(cls, roles: List[Role], witch_rule: WitchRule, guard_rule: GuardRule) -> 'Room':
+        """Create room without registering it"""
+        return cls(
+            id=None,
+            # Static settings
+            roles=copy(roles),
+            witch_rule=witch_rule,
+            guard_rule=guard_rule,
+            # Dynamic
+            started=False,
+            roles_pool=copy(roles),
+            players=dict(),
+            seats=list(),
+            round=0,
+            stage=None,
+            waiting=False,
+            rematch_at=None,
+            log=list(),
+            votes=dict(),
+            vote_counts=Counter(),
+            last_active=time.monotonic(),
+            # Internal
+            logic_task=None,
+            commands=None,
+            command_loop=None,
+            version=0,
+            alive_version=0,
+            buttons_cache=dict(),
+            buttons_cache_version=0,
+            journal=None,
         )
 
     @classmethod
@@ -0,0 +1,102 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, TYPE_CHECKING, List
+
+from models.system import Config, Global
+
+if TYPE_CHECKING:
+    from .room import Room
+
+
+class Snapshot:
+    """
+    服务器状态快照，供管理页面查询
+
+    房间状态变化时由 Room 增量更新对应房间的摘要及其 JSON，查询时直接拼接缓存，无需遍历房间和用户
+    """
+    version = 0  # 快照版本，任一房间变化时递增
+    rooms: Dict[str, dict] = dict()  # 房间号 -> 房间摘要
+    rooms_json: Dict[str, str] = dict()  # 房间号 -> 房间摘要 JSON
+    stage_since: Dict[str, float] = dict()  # 游戏中的房间 -> 进入当前阶段的时间，按时间先后排序
+    updates: 'OrderedDict[str, int]' = OrderedDict()  # 房间号 -> 最后一次变化时的快照版本，按版本排序，包括已注销的房间
+    pruned = 0  # 该版本及之前注销的房间已从 updates 中清理
+    cache: Optional[str] = None  # 房间列表 JSON 缓存
+
+    @classmethod
+    def update_room(cls, room: 'Room'):
+        key = str(room.id)
+        prev = cls.rooms.get(key)
+        stage = room.stage.value if room.stage else None
+
+        if not room.started:
+            cls.stage_since.pop(key, None)
+        elif prev is None or not prev['started'] or prev['stage'] != stage:
+            # 重新插入，保持 stage_since 按时间排序
+            cls.stage_since.pop(key, None)
+            cls.stage_since[key] = time.time()
+
+        summary = dict(
+            id=room.id,
+            started=room.started,
+            round=room.round,
+            stage=stage,
+            waiting=room.waiting,
+            host=room.get_host().nick if room.players else None,
+            players=list(room.players),
+            capacity=len(room.roles),
+            stage_since=cls.stage_since.get(key),
+        )
+        cls.rooms[key] = summary
+        cls.rooms_json[key] = json.dumps(summary, ensure_ascii=False)
+        cls.changed(key)
+
+    @classmethod
+    def remove_room(cls, room_id):
+        key = str(room_id)
+        cls.rooms.pop(key, None)
+        cls.rooms_json.pop(key, None)
+        cls.stage_since.pop(key, None)
+        cls.changed(key)
+
+        # 已注销房间的记录过多时清理，版本更早的查询方需要全量刷新
+        if len(cls.updates) - len(cls.rooms) > max(len(cls.rooms), 100):
+            cls.updates = OrderedDict((key, version) for key, version in cls.updates.items() if key in cls.rooms)
+            cls.pruned = cls.version
+
+    @classmethod
+    def changed(cls, key: str):
+        cls.version += 1
+        cls.cache = None
+        cls.updates[key] = cls.version
+        cls.updates.move_to_end(key)
+
+    @classmethod
+    def changes(cls, since: int) -> Optional[List[str]]:
+        """快照版本 since 之后变化过的房间号，按变化先后排序，需要全量刷新时返回 None"""
+        if since < cls.pruned:
+            return None
+        keys = []
+        for key in reversed(cls.updates):
+            if cls.updates[key] <= since:
+                break
+            keys.append(key)
+        return keys[::-1]
+
+    @classmethod
+    def stuck_rooms(cls) -> List[str]:
+        """在同一游戏阶段停留超过 Config.STUCK_STAGE_SECONDS 的房间，只检查最早进入当前阶段的若干房间"""
+        deadline = time.time() - Config.STUCK_STAGE_SECONDS
+        stuck = []
+        for key, since in cls.stage_since.items():
+            if since > deadline:
+                break
+            stuck.append(key)
+        return stuck
+
+    @classmethod
+    def to_json(cls) -> str:
+        if cls.cache is None:
+            cls.cache = f'"version": {cls.version}, "rooms": [{", ".join(cls.rooms_json.values())}]'
+        return f'{{{cls.cache}, "users": {len(Global.users)}, ' \
+               f'"stuck_after": {Config.STUCK_STAGE_SECONDS}, "stuck": {json.dumps(cls.stuck_rooms())}}}'
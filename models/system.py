@@ -9,11 +9,42 @@ if TYPE_CHECKING:
 class Config:
     SYS_NICK = '📢'
 
+    # 准入控制，None 表示不限制
+    MAX_SESSIONS = 500  # 最大 session 数，包括尚未输入昵称的 session
+    MAX_ROOMS = 100  # 最大房间数
+
+    # 空闲回收，单位为秒，None 表示不回收
+    LOGIN_TIMEOUT = 120  # 未输入昵称的 session
+    LOBBY_IDLE_TIMEOUT = 300  # 未进入房间的用户
+    ROOM_IDLE_TIMEOUT = 1800  # 未开始游戏的房间
+    IDLE_CHECK_INTERVAL = 10
+
+    ROOM_COMMAND_QUEUE_SIZE = 100  # 单个房间待执行的状态修改命令上限
+
+    VOTE_TIMEOUT = 120  # 白天投票时限，单位为秒
+    REMATCH_COUNTDOWN = 30  # 游戏结束后自动开始下一局的倒计时，单位为秒，None 表示不自动开始
+    EMPTY_ROOM_KEEPALIVE = 60  # 未开始游戏的空房间保留时间，单位为秒，None 表示立即注销
+
+    TTS = True  # 语音播报
+    REPLAY_DIR = 'replays'  # 对局记录保存目录，None 表示不保存
+
+    ADMIN_TOKEN = None  # 管理页面令牌，None 表示不启用管理页面
+    STUCK_STAGE_SECONDS = 300  # 游戏阶段停留超过该时间的房间在管理页面中高亮，单位为秒
+
 
 class Global:
+    sessions = 0  # 当前 session 数
     users = dict()
     rooms: Dict[str, 'Room'] = dict()
 
+    @classmethod
+    def is_sessions_full(cls) -> bool:
+        return Config.MAX_SESSIONS is not None and cls.sessions >= Config.MAX_SESSIONS
+
+    @classmethod
+    def is_rooms_full(cls) -> bool:
+        return Config.MAX_ROOMS is not None and len(cls.rooms) >= Config.MAX_ROOMS
+
     @classmethod
     def reg_room(cls, room: 'Room') -> 'Room':
         if room.id is not None:
@@ -1,5 +1,7 @@
 import asyncio
+import time
 from dataclasses import dataclass
+from functools import wraps
 from typing import Optional, TYPE_CHECKING, Any
 
 from pywebio import run_async
@@ -10,6 +12,7 @@ from pywebio.session.coroutinebased import TaskHandle
 from enums import Role, PlayerStatus, LogCtrl, WitchRule, GuardRule, GameStage
 from models.system import Config, Global
 from stub import OutputHandler
+from utils import close_current_session
 from . import logger
 
 if TYPE_CHECKING:
@@ -23,9 +26,11 @@ def player_action(func):
     1. 仅用于 User 类下的游戏角色操作
     2. 被装饰的函数返回字符串时，将返回错误信息给当前用户，并继续锁定
     3. 返回 None / True 时，将解锁游戏阶段
+    4. 操作作为命令提交到房间的命令队列执行，调用时需要 await
     """
 
-    def wrapper(self: 'User', *args, **kwargs):
+    @wraps(func)
+    def command(self: 'User', *args, **kwargs):
         if self.room is None or self.room.waiting is not True:
             return
         if not self.should_act():
@@ -40,37 +45,58 @@ def player_action(func):
 
         return rv
 
+    @wraps(func)
+    async def wrapper(self: 'User', *args, **kwargs):
+        if self.room is None:
+            return
+        return await self.room.execute(command, self, *args, **kwargs)
+
+    wrapper.command = command  # 供回放时直接执行
     return wrapper
 
 
 @dataclass
 class User:
+    __slots__ = (
+        'nick', 'main_task_id', 'input_blocking', 'last_active',
+        'room', 'role', 'witch_heal', 'witch_poison', 'guard_last_protect', 'status',
+        'game_msg', 'game_msg_syncer', 'idle_reaper',
+    )
+
     nick: str
     # Session
     main_task_id: Any  # 主 Task 线程 id
     input_blocking: bool
+    last_active: float  # 最后一次操作的时间，time.monotonic()
 
     # Game
     room: Optional['Room']  # 所在房间
     role: Optional[Role]  # 角色
-    skill: dict  # 角色技能
+    witch_heal: bool  # 女巫技能：持有解药
+    witch_poison: bool  # 女巫技能：持有毒药
+    guard_last_protect: Optional[str]  # 守卫技能：上一晚守护的玩家
     status: Optional[PlayerStatus]  # 玩家状态
 
     game_msg: OutputHandler  # 游戏日志 UI Handler
     game_msg_syncer: Optional[TaskHandle]  # 游戏日志同步线程
+    idle_reaper: Optional[TaskHandle]  # 空闲回收线程
 
     def __str__(self):
         return self.nick
 
     __repr__ = __str__
 
+    def log_context(self) -> dict:
+        """结构化日志字段"""
+        return dict(self.room.log_context() if self.room else dict(), nick=self.nick)
+
     # 房间
     def send_msg(self, text):
         """发送仅该用户可见的房间消息"""
         if self.room:
             self.room.send_msg(text, nick=self.nick)
         else:
-            logger.warning('在玩家非进入房间状态时调用了 User.send_msg()')
+            logger.warning('在玩家非进入房间状态时调用了 User.send_msg()', extra=self.log_context())
 
     async def _game_msg_syncer(self):
         """
@@ -115,6 +141,40 @@ class User:
         self.game_msg_syncer.close()
         self.game_msg_syncer = None
 
+    # 空闲回收
+    def touch(self):
+        """记录用户操作时间"""
+        self.last_active = time.monotonic()
+
+    def is_idle(self) -> bool:
+        """用户在大厅，或所在房间未开始游戏，且超过了对应的空闲时间"""
+        now = time.monotonic()
+        if self.room is None:
+            return Config.LOBBY_IDLE_TIMEOUT is not None and \
+                now - self.last_active > Config.LOBBY_IDLE_TIMEOUT
+        if not self.room.started:
+            return Config.ROOM_IDLE_TIMEOUT is not None and \
+                now - self.room.last_active > Config.ROOM_IDLE_TIMEOUT
+        return False
+
+    async def _idle_reaper(self):
+        """
+        空闲用户回收
+
+        运行在用户 session 上，超时后关闭 session，由 session 的 defer_call 完成 User.free
+        """
+        while not self.is_idle():
+            await asyncio.sleep(Config.IDLE_CHECK_INTERVAL)
+
+        logger.info('用户 "%s" 长时间未操作，断开连接', self.nick, extra=self.log_context())
+        close_current_session()
+
+    def stop_idle_reaper(self):
+        """结束空闲回收逻辑，session 的主 Task 结束时调用，避免空闲回收线程使 session 无法结束"""
+        if self.idle_reaper is not None:
+            self.idle_reaper.close()
+            self.idle_reaper = None
+
     # 玩家状态
     def should_act(self):
         """当前处于该玩家进行操作的阶段"""
@@ -128,15 +188,27 @@ class User:
         }
         return self.role in stage_map.get(self.room.stage, []) and self.status != PlayerStatus.DEAD
 
+    def can_vote(self):
+        """处于投票阶段，该玩家存活且尚未投票"""
+        return self.room.stage == GameStage.VOTE and \
+            self.status != PlayerStatus.DEAD and \
+            self.nick not in self.room.votes
+
     def witch_has_heal(self):
         """女巫持有解药"""
-        return self.skill.get('heal') is True
+        return self.witch_heal is True
 
     def witch_has_poison(self):
         """女巫持有毒药"""
-        return self.skill.get('poison') is True
+        return self.witch_poison is True
 
     # 玩家操作
+    async def vote(self, nick: Optional[str]):
+        """白天投票，nick 为 None 时弃票"""
+        if self.room is None:
+            return
+        await self.room.execute(self.room.cast_vote, self.nick, nick)
+
     @player_action
     def skip(self):
         pass
@@ -170,7 +242,7 @@ class User:
 
     @player_action
     def guard_protect_player(self, nick):
-        if self.skill['last_protect'] == nick:
+        if self.guard_last_protect == nick:
             return '两晚不可守卫同一玩家'
 
         if self.room.players[nick].status == PlayerStatus.PENDING_HEAL and \
@@ -199,21 +271,31 @@ class User:
             return '昵称已被使用'
 
     @classmethod
-    def alloc(cls, nick, init_task_id) -> 'User':
-        if nick in Global.users:
-            raise ValueError
-        Global.users[nick] = cls(
+    def new(cls, nick, init_task_id, game_msg: Optional[OutputHandler]) -> 'User':
+        """创建用户，不注册到 Global"""
+        return cls(
             nick=nick,
             main_task_id=init_task_id,
             input_blocking=False,
+            last_active=time.monotonic(),
             room=None,
             role=None,
-            skill=dict(),
+            witch_heal=False,
+            witch_poison=False,
+            guard_last_protect=None,
             status=None,
-            game_msg=output(),
-            game_msg_syncer=None
+            game_msg=game_msg,
+            game_msg_syncer=None,
+            idle_reaper=None,
         )
-        logger.info(f'用户 "{nick}" 登录')
+
+    @classmethod
+    def alloc(cls, nick, init_task_id) -> 'User':
+        if nick in Global.users:
+            raise ValueError
+        user = Global.users[nick] = cls.new(nick, init_task_id, game_msg=output())
+        user.idle_reaper = run_async(user._idle_reaper())
+        logger.info('用户 "%s" 登录', nick, extra=dict(nick=nick))
         return Global.users[nick]
 
     @classmethod
@@ -223,4 +305,4 @@ class User:
         # 从房间移除用户
         if user.room:
             user.room.remove_player(user)
-        logger.info(f'用户 "{user.nick}" 注销')
+        logger.info('用户 "%s" 注销', user.nick, extra=dict(nick=user.nick))
@@ -0,0 +1,99 @@
+"""
+对局回放
+
+按对局记录重新执行 Room/User 的命令，不等待任何计时，并校验重新生成的对局记录与原记录一致
+
+    python replay.py replays/*.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+from typing import List, Optional
+
+from enums import Role, WitchRule, GuardRule
+from models.replay import ReplayRecorder, decode
+from models.room import Room
+from models.system import Config
+from models.user import User
+
+
+def load(path) -> List[dict]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(events: List[dict]) -> ReplayRecorder:
+    """重新执行一局游戏，返回重新生成的对局记录"""
+    game = events[0]
+    if game['type'] != 'game':
+        raise ValueError('对局记录应以 game 事件开始')
+
+    room = Room.new(
+        roles=[Role[name] for name in game['roles']],
+        witch_rule=WitchRule[game['witch_rule']],
+        guard_rule=GuardRule[game['guard_rule']],
+    )
+    room.roles_pool = [Role[name] for name in game['roles_pool']]
+    for nick in game['players']:
+        user = User.new(nick, None, game_msg=None)
+        user.room = room
+        room.players[nick] = user
+
+    recorder = ReplayRecorder()
+    room.deal_roles(seed=game['seed'], journal=recorder)
+
+    for event in events:
+        # 游戏进行中玩家进出房间会影响胜负判断，按记录顺序重现
+        if event['type'] == 'join':
+            room.seat_player(User.new(event['nick'], None, game_msg=None))
+            continue
+        if event['type'] == 'leave':
+            room.unseat_player(room.players[event['nick']])
+            continue
+        if event['type'] != 'cmd':
+            continue
+        args = [decode(arg) for arg in event['args']]
+        kwargs = {key: decode(value) for key, value in event['kwargs'].items()}
+        if event['actor'] is None:
+            func = getattr(room, event['cmd'])
+        else:
+            func = getattr(User, event['cmd']).command
+            args.insert(0, room.players[event['actor']])
+        room.record_command(func, args, kwargs)
+        func(*args, **kwargs)
+
+    return recorder
+
+
+def check(path) -> Optional[str]:
+    """回放一个对局记录文件，记录不一致时返回错误信息"""
+    events = load(path)
+    replayed = replay(events).events
+    for idx, (expected, actual) in enumerate(zip(events, replayed)):
+        if expected != actual:
+            return f'第 {idx + 1} 条记录不一致\n  记录: {expected}\n  回放: {actual}'
+    if len(events) != len(replayed):
+        return f'记录共 {len(events)} 条，回放共 {len(replayed)} 条'
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='回放并校验对局记录')
+    parser.add_argument('files', nargs='+', help='对局记录文件')
+    args = parser.parse_args()
+
+    Config.TTS = False
+    Config.REPLAY_DIR = None
+
+    failed = 0
+    started_at = time.perf_counter()
+    for path in args.files:
+        error = check(path)
+        if error:
+            failed += 1
+            print(f'FAIL {path}: {error}')
+    cost = time.perf_counter() - started_at
+
+    print(f'回放 {len(args.files)} 局，失败 {failed} 局，耗时 {cost:.2f} 秒')
+    sys.exit(1 if failed else 0)
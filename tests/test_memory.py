@@ -0,0 +1,61 @@
+"""
+User / Room 内存预算
+
+按实例平均的 tracemalloc 增量计算，不包含 PyWebIO 的 session 与输出控件。
+超出预算说明 User / Room 的表示方式出现了回退（如丢失 __slots__、增加了按实例的容器）
+"""
+import tracemalloc
+
+from enums import Role, WitchRule, GuardRule
+from models.room import Room
+from models.system import Config
+from models.user import User
+
+# 单位为字节，实测约为 250 / 6200
+IDLE_USER_BUDGET = 320  # 大厅中的空闲用户
+ACTIVE_ROOM_BUDGET = 8 * 1024  # 已分配身份的 12 人房间，包括房间内的 User
+
+ROLES_12 = [Role.WOLF] * 3 + [Role.WOLF_KING] + [Role.CITIZEN] * 4 + \
+           [Role.DETECTIVE, Role.WITCH, Role.GUARD, Role.HUNTER]
+
+
+def measure(factory, count) -> float:
+    """创建 count 个实例，返回平均每个实例新增的内存"""
+    objects = [factory(-1)]  # 预热，排除首次创建时的缓存
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects.extend(factory(idx) for idx in range(count))
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / count
+
+
+def idle_user(idx) -> User:
+    return User.new(f'玩家{idx}', None, game_msg=None)
+
+
+def active_room(idx) -> Room:
+    room = Room.new(ROLES_12, WitchRule.SELF_RESCUE_FIRST_NIGHT_ONLY, GuardRule.MED_CONFLICT)
+    for seat in range(len(ROLES_12)):
+        user = User.new(f'房间{idx}玩家{seat}', None, game_msg=None)
+        user.room = room
+        room.players[user.nick] = user
+    room.deal_roles(seed=idx)
+    return room
+
+
+def setup_module():
+    Config.TTS = False
+    Config.REPLAY_DIR = None
+
+
+def test_idle_user_budget():
+    size = measure(idle_user, 500)
+    assert size <= IDLE_USER_BUDGET, f'空闲用户占用 {size:.0f} 字节，超出预算 {IDLE_USER_BUDGET} 字节'
+
+
+def test_active_room_budget():
+    size = measure(active_room, 50)
+    assert size <= ACTIVE_ROOM_BUDGET, f'12 人房间占用 {size:.0f} 字节，超出预算 {ACTIVE_ROOM_BUDGET} 字节'
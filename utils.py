@@ -1,13 +1,13 @@
+import asyncio
 import random
 import socket
 import subprocess
 import threading
+import time
 import traceback
 from logging import getLogger
 from sys import platform
 
-import pyttsx3
-
 logger = getLogger('Utils')
 logger.setLevel('DEBUG')
 
@@ -21,6 +21,8 @@ def say(text):
         subprocess.Popen(['say', '-r', '10000', text])
     elif platform == "win32":
         def wrapper():
+            import pyttsx3  # 仅 Windows 需要，延迟导入以加快启动
+
             tts = pyttsx3.init()
             tts.say(text)
             tts.runAndWait()
@@ -28,18 +30,54 @@ def say(text):
         threading.Thread(target=wrapper).start()
 
     else:
-        logger.warning(f'{platform} 暂不支持TTS语音播报')
+        logger.warning('%s 暂不支持TTS语音播报', platform)
 
 
 def get_interface_ip() -> str:
     try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(('8.8.8.8', 80))
-        return s.getsockname()[0] or '获取失败'
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.settimeout(1)
+            s.connect(('8.8.8.8', 80))
+            return s.getsockname()[0] or '获取失败'
     except Exception:
         traceback.print_exc()
         return '获取失败'
 
 
+def run_in_background(func, *args):
+    """在后台线程中运行可选的、耗时的初始化逻辑，不阻塞启动"""
+    threading.Thread(target=func, args=args, daemon=True).start()
+
+
+class StartupProfile:
+    """记录启动各阶段的耗时"""
+
+    def __init__(self, start: float):
+        self.start = start
+        self.last = start
+        self.stages = []
+
+    def mark(self, stage: str, at: float = None):
+        """记录从上一阶段结束到 at（默认为现在）的耗时"""
+        at = time.perf_counter() if at is None else at
+        self.stages.append((stage, at - self.last))
+        self.last = at
+
+    def report(self) -> str:
+        lines = [f'{stage}: {cost * 1000:.1f} ms' for stage, cost in self.stages]
+        lines.append(f'总计: {(self.last - self.start) * 1000:.1f} ms')
+        return '\n'.join(lines)
+
+
+def close_current_session():
+    """关闭当前 session，可在 session 的 Task 内调用"""
+    from pywebio.session import get_current_session
+
+    session = get_current_session()
+    session.send_task_command(dict(command='close_session'))
+    # 不能在 session 的 Task 内直接关闭 session
+    asyncio.get_event_loop().call_soon(session.close)
+
+
 def add_cancel_button(buttons: list):
     return buttons + [{'label': '放弃', 'type': 'cancel'}]